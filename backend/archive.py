@@ -0,0 +1,24 @@
+"""Move past academic years of assignments and submissions into archive collections.
+
+Usage: python archive.py --before-year 2024
+"""
+import asyncio
+
+import typer
+
+from server import ARCHIVE_BATCH_SIZE, archive_academic_years
+
+
+def main(
+    before_year: int = typer.Option(..., help="First academic year to keep hot, e.g. 2024 for 2024-25"),
+    batch_size: int = typer.Option(ARCHIVE_BATCH_SIZE, help="Assignments copied per bulk batch"),
+):
+    archived = asyncio.run(archive_academic_years(before_year, batch_size))
+    if not archived:
+        typer.echo("Nothing to archive")
+    for year, count in sorted(archived.items()):
+        typer.echo(f"Archived {count} assignments from academic year {year}-{year + 1}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Request
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field
@@ -8,8 +9,20 @@ import uuid
 import os
 import json
 import hashlib
+import ipaddress
+import math
+import mimetypes
+import re
+import shutil
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+import anyio
+import unicodedata
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import ASCENDING, DESCENDING
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, ReplaceOne
+from pymongo.errors import DuplicateKeyError
 import jwt
 from dotenv import load_dotenv
 
@@ -38,6 +51,8 @@ users_collection = db.users
 lessons_collection = db.lessons
 assignments_collection = db.assignments
 submissions_collection = db.submissions
+answer_signatures_collection = db.answer_signatures
+rate_limits_collection = db.rate_limits
 
 # JWT settings
 SECRET_KEY = "marathi_vidya_secret_key_2024"
@@ -46,6 +61,90 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 security = HTTPBearer()
 
+# Near-duplicate answer detection settings (MinHash/LSH)
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+SHINGLE_SIZE = 3
+# Short answers ("लाल") legitimately repeat across a class, so they are not signed
+MIN_ANSWER_TOKENS = 4
+MIN_ANSWER_SHINGLES = 12
+SIMILARITY_THRESHOLD = 0.8
+_MERSENNE_PRIME = (1 << 61) - 1
+_MINHASH_COEFFICIENTS = [
+    (
+        int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % (_MERSENNE_PRIME - 1) + 1,
+        int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME,
+    )
+    for i in range(MINHASH_PERMUTATIONS)
+]
+
+# Devanagari vowel signs folded onto their short forms, plus marks that
+# students commonly drop or swap (nukta, chandrabindu, zero-width joiners)
+_MATRA_FOLDING = str.maketrans({
+    "\u0940": "\u093F",  # ी -> ि
+    "\u0942": "\u0941",  # ू -> ु
+    "\u0901": "\u0902",  # ँ -> ं
+    "\u0948": "\u0947",  # ै -> े
+    "\u094C": "\u094B",  # ौ -> ो
+    "\u0908": "\u0907",  # ई -> इ
+    "\u090A": "\u0909",  # ऊ -> उ
+    "\u093C": None,       # nukta
+    "\u200C": None,       # zero-width non-joiner
+    "\u200D": None,       # zero-width joiner
+    "\u0964": " ",        # danda
+    "\u0965": " ",        # double danda
+    **{chr(0x0966 + d): str(d) for d in range(10)},  # Devanagari digits
+})
+_NON_WORD_RE = re.compile(r"[^\w\u0900-\u097F]+")
+
+# Login rate limiting settings
+# Whole classes log in together from one school NAT, so the student IP
+# bucket is sized well above several classes; accounts are limited tightly
+STUDENT_LOGIN_RATE_LIMIT_IP_CAPACITY = int(os.getenv("STUDENT_LOGIN_RATE_LIMIT_IP_CAPACITY", "300"))
+STUDENT_LOGIN_RATE_LIMIT_IP_PER_MINUTE = float(os.getenv("STUDENT_LOGIN_RATE_LIMIT_IP_PER_MINUTE", "300"))
+TEACHER_LOGIN_RATE_LIMIT_IP_CAPACITY = int(os.getenv("TEACHER_LOGIN_RATE_LIMIT_IP_CAPACITY", "60"))
+TEACHER_LOGIN_RATE_LIMIT_IP_PER_MINUTE = float(os.getenv("TEACHER_LOGIN_RATE_LIMIT_IP_PER_MINUTE", "60"))
+LOGIN_RATE_LIMIT_ACCOUNT_CAPACITY = int(os.getenv("LOGIN_RATE_LIMIT_ACCOUNT_CAPACITY", "5"))
+LOGIN_RATE_LIMIT_ACCOUNT_PER_MINUTE = float(os.getenv("LOGIN_RATE_LIMIT_ACCOUNT_PER_MINUTE", "5"))
+RATE_LIMIT_SHARDS = 16
+RATE_LIMIT_MAX_KEYS_PER_SHARD = 4096
+# Set to "mongo" to share limits across workers
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+# Peers (addresses or networks, "*" for any) whose X-Forwarded-For is trusted.
+# The default covers loopback and the private ranges the deployment ingress
+# connects from; narrow it if untrusted clients can connect from those ranges.
+FORWARDED_ALLOW_IPS = [
+    item.strip() for item in os.getenv(
+        "FORWARDED_ALLOW_IPS", "127.0.0.1,::1,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16"
+    ).split(",") if item.strip()
+]
+_TRUST_ALL_PROXIES = "*" in FORWARDED_ALLOW_IPS
+_TRUSTED_PROXY_NETWORKS = [
+    ipaddress.ip_network(item, strict=False) for item in FORWARDED_ALLOW_IPS if item != "*"
+]
+
+# Archival settings
+# Anchored to this module so the server and archive.py agree on file locations
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_DIR = os.path.join(BASE_DIR, os.getenv("UPLOAD_DIR", "uploads"))
+COLD_STORAGE_DIR = os.path.join(BASE_DIR, os.getenv("COLD_STORAGE_DIR", "uploads_cold"))
+# Month (1-12) in which a new academic year starts
+ACADEMIC_YEAR_START_MONTH = int(os.getenv("ACADEMIC_YEAR_START_MONTH", "6"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+
+# Screenshot serving settings
+SCREENSHOT_CHUNK_SIZE = 64 * 1024
+# Screenshot file names are unique per upload, so their bytes never change
+SCREENSHOT_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+# Lesson search settings
+SEARCH_FIELD_WEIGHTS = {"title": 3.0, "description": 2.0, "questions": 1.0}
+# Prefix-expanded terms score below any exact match, even a question-only one
+SEARCH_PREFIX_WEIGHT = 0.25
+SEARCH_DEFAULT_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
 # Pydantic models
 class StudentLogin(BaseModel):
     student_code: str
@@ -98,6 +197,562 @@ def serialize_doc(doc):
         return serialized
     return doc
 
+def normalize_marathi_text(text: str) -> str:
+    """Normalize mixed Devanagari/English text so trivially different spellings compare equal"""
+    text = unicodedata.normalize("NFKC", text).lower().translate(_MATRA_FOLDING)
+    text = _NON_WORD_RE.sub(" ", text)
+    return " ".join(text.split())
+
+def compute_minhash(text: str) -> List[int]:
+    """MinHash signature over character shingles of a normalized answer"""
+    if len(text) <= SHINGLE_SIZE:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for shingle in shingles
+    ]
+    return [
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+        for a, b in _MINHASH_COEFFICIENTS
+    ]
+
+def compute_lsh_buckets(signature: List[int]) -> List[str]:
+    """Split a MinHash signature into banded LSH bucket keys"""
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(",".join(map(str, rows)).encode(), digest_size=8).hexdigest()
+        buckets.append(f"{band}:{digest}")
+    return buckets
+
+def estimate_similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+def build_answer_signatures(submission: dict, assignment: dict, lesson: dict) -> List[dict]:
+    """Build signature documents for the text answers of a submission"""
+    text_question_ids = {
+        question["id"] for question in lesson.get("questions", [])
+        if question.get("type") == "text"
+    }
+    # Answers have always been stored as submitted; only objects can be indexed
+    if not isinstance(submission["answers"], dict):
+        return []
+    signatures = []
+    for question_id, answer in submission["answers"].items():
+        if question_id not in text_question_ids or not isinstance(answer, str):
+            continue
+        normalized = normalize_marathi_text(answer)
+        if (len(normalized.split()) < MIN_ANSWER_TOKENS
+                or len(normalized) - SHINGLE_SIZE + 1 < MIN_ANSWER_SHINGLES):
+            continue
+        minhash = compute_minhash(normalized)
+        signatures.append({
+            "id": str(uuid.uuid4()),
+            "submission_id": submission["id"],
+            "assignment_id": assignment["id"],
+            "teacher_id": assignment["teacher_id"],
+            "student_id": submission["student_id"],
+            "lesson_id": assignment["lesson_id"],
+            "question_id": question_id,
+            "answer": answer,
+            "normalized": normalized,
+            "minhash": minhash,
+            "lsh_buckets": compute_lsh_buckets(minhash),
+            "created_at": datetime.utcnow()
+        })
+    return signatures
+
+class LessonSearchIndex:
+    """In-process inverted index over lesson titles, descriptions and questions.
+
+    Postings are kept per grade so a teacher's query only touches their own
+    catalog. Each grade remembers the Mongo version (lesson count and latest
+    ``updated_at``) it was built from and is reloaded when that changes.
+    """
+
+    def __init__(self):
+        self.postings: Dict[int, Dict[str, Dict[str, float]]] = {}
+        self.vocabulary: Dict[int, List[str]] = {}
+        self.lesson_terms: Dict[str, tuple] = {}
+        self.lesson_counts: Dict[int, int] = {}
+        self.versions: Dict[int, tuple] = {}
+
+    def add_lesson(self, lesson: dict):
+        self.remove_lesson(lesson["id"])
+        grade = lesson["grade"]
+        weights: Dict[str, float] = {}
+        fields = {
+            "title": lesson.get("title", ""),
+            "description": lesson.get("description", ""),
+            "questions": " ".join(q.get("question", "") for q in lesson.get("questions", [])),
+        }
+        for field, text in fields.items():
+            for token in normalize_marathi_text(text).split():
+                weights[token] = weights.get(token, 0.0) + SEARCH_FIELD_WEIGHTS[field]
+        
+        grade_postings = self.postings.setdefault(grade, {})
+        for token, weight in weights.items():
+            grade_postings.setdefault(token, {})[lesson["id"]] = weight
+        self.lesson_terms[lesson["id"]] = (grade, list(weights))
+        self.lesson_counts[grade] = self.lesson_counts.get(grade, 0) + 1
+        self.vocabulary.pop(grade, None)
+
+    def remove_lesson(self, lesson_id: str):
+        if lesson_id not in self.lesson_terms:
+            return
+        grade, tokens = self.lesson_terms.pop(lesson_id)
+        self.lesson_counts[grade] -= 1
+        grade_postings = self.postings.get(grade, {})
+        for token in tokens:
+            grade_postings[token].pop(lesson_id, None)
+            if not grade_postings[token]:
+                del grade_postings[token]
+        self.vocabulary.pop(grade, None)
+
+    def _expand_prefix(self, grade: int, prefix: str) -> List[str]:
+        vocabulary = self.vocabulary.get(grade)
+        if vocabulary is None:
+            vocabulary = sorted(self.postings.get(grade, {}))
+            self.vocabulary[grade] = vocabulary
+        matches = []
+        for i in range(bisect_left(vocabulary, prefix), len(vocabulary)):
+            if not vocabulary[i].startswith(prefix):
+                break
+            matches.append(vocabulary[i])
+        return matches
+
+    def search(self, grade: int, query: str) -> List[tuple]:
+        """Return (lesson_id, score) pairs, best match first"""
+        tokens = normalize_marathi_text(query).split()
+        grade_postings = self.postings.get(grade, {})
+        if not tokens or not grade_postings:
+            return []
+        
+        lesson_count = self.lesson_counts[grade]
+        scores: Dict[str, float] = {}
+        # The last token may still be being typed, so match it as a prefix
+        for position, token in enumerate(tokens):
+            if position == len(tokens) - 1:
+                terms = self._expand_prefix(grade, token)
+            else:
+                terms = [token] if token in grade_postings else []
+            for term in terms:
+                postings = grade_postings[term]
+                idf = math.log(1 + lesson_count / len(postings))
+                if term != token:
+                    idf *= SEARCH_PREFIX_WEIGHT
+                for lesson_id, weight in postings.items():
+                    scores[lesson_id] = scores.get(lesson_id, 0.0) + weight * idf
+        
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+lesson_search_index = LessonSearchIndex()
+
+class TokenBucketLimiter:
+    """Sharded in-memory token buckets with LRU eviction of idle keys.
+
+    Each bucket is updated without awaiting, so on the event loop no lock is
+    needed. Every shard holds at most ``max_keys_per_shard`` buckets; the least
+    recently used one is dropped first, which bounds memory under key floods.
+    """
+
+    def __init__(self, capacity: int, per_minute: float, shards: int = RATE_LIMIT_SHARDS,
+                 max_keys_per_shard: int = RATE_LIMIT_MAX_KEYS_PER_SHARD):
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self.max_keys_per_shard = max_keys_per_shard
+        self.shards = [OrderedDict() for _ in range(shards)]
+
+    def consume(self, key: str) -> float:
+        """Take one token for ``key``; return 0 if allowed, else seconds to wait"""
+        shard = self.shards[hash(key) % len(self.shards)]
+        now = time.monotonic()
+        bucket = shard.get(key)
+        if bucket is None:
+            bucket = [float(self.capacity), now]
+            shard[key] = bucket
+            if len(shard) > self.max_keys_per_shard:
+                shard.popitem(last=False)
+        else:
+            shard.move_to_end(key)
+            bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+LOGIN_IP_LIMITS = {
+    "student": (STUDENT_LOGIN_RATE_LIMIT_IP_CAPACITY, STUDENT_LOGIN_RATE_LIMIT_IP_PER_MINUTE),
+    "teacher": (TEACHER_LOGIN_RATE_LIMIT_IP_CAPACITY, TEACHER_LOGIN_RATE_LIMIT_IP_PER_MINUTE),
+}
+login_ip_limiters = {
+    role: TokenBucketLimiter(capacity, per_minute)
+    for role, (capacity, per_minute) in LOGIN_IP_LIMITS.items()
+}
+login_account_limiter = TokenBucketLimiter(LOGIN_RATE_LIMIT_ACCOUNT_CAPACITY, LOGIN_RATE_LIMIT_ACCOUNT_PER_MINUTE)
+
+async def consume_shared_token(key: str, capacity: int, per_minute: float) -> float:
+    """Atomic token bucket stored in Mongo so all workers see the same limit"""
+    now = datetime.utcnow()
+    refilled = {"$min": [capacity, {"$add": [
+        {"$ifNull": ["$tokens", capacity]},
+        {"$multiply": [
+            {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]},
+            per_minute / 60.0
+        ]}
+    ]}]}
+    update = [
+        {"$set": {"tokens": refilled, "updated_at": now}},
+        {"$set": {
+            "allowed": {"$gte": ["$tokens", 1]},
+            "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]}
+        }}
+    ]
+    try:
+        bucket = await rate_limits_collection.find_one_and_update(
+            {"key": key}, update, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Another worker created the bucket concurrently; it exists now
+        bucket = await rate_limits_collection.find_one_and_update(
+            {"key": key}, update, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    if bucket["allowed"]:
+        return 0.0
+    return (1 - bucket["tokens"]) / (per_minute / 60.0)
+
+def is_trusted_proxy(host: Optional[str]) -> bool:
+    if _TRUST_ALL_PROXIES:
+        return True
+    try:
+        address = ipaddress.ip_address(host)
+    except (TypeError, ValueError):
+        return False
+    return any(address in network for network in _TRUSTED_PROXY_NETWORKS)
+
+def get_client_ip(request: Request) -> str:
+    """Address of the client as seen by the outermost trusted proxy.
+
+    Proxies append the address they received a request from, so the header
+    is walked from the right and the first untrusted hop wins. Entries left
+    of it are client-supplied and never used.
+    """
+    peer = request.client.host if request.client else None
+    forwarded = request.headers.get("x-forwarded-for")
+    if not forwarded or not is_trusted_proxy(peer):
+        return peer or "unknown"
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not is_trusted_proxy(hop):
+            return hop
+    return hops[0] if hops else peer
+
+async def enforce_login_rate_limit(request: Request, role: str, account: str):
+    """Reject throttled login attempts before any database or hashing work"""
+    ip_capacity, ip_per_minute = LOGIN_IP_LIMITS[role]
+    checks = [
+        (login_ip_limiters[role], f"ip:{role}:{get_client_ip(request)}",
+         ip_capacity, ip_per_minute),
+        (login_account_limiter, f"account:{role}:{account}",
+         LOGIN_RATE_LIMIT_ACCOUNT_CAPACITY, LOGIN_RATE_LIMIT_ACCOUNT_PER_MINUTE),
+    ]
+    for limiter, key, capacity, per_minute in checks:
+        retry_after = limiter.consume(key)
+        # The local bucket absorbs floods; the shared store is only consulted
+        # for attempts this worker would otherwise let through
+        if not retry_after and RATE_LIMIT_BACKEND == "mongo":
+            retry_after = await consume_shared_token(key, capacity, per_minute)
+        if retry_after:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many login attempts. Please try again later.",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+
+def academic_year_of(moment: datetime) -> int:
+    """Calendar year in which the academic year containing ``moment`` started"""
+    return moment.year if moment.month >= ACADEMIC_YEAR_START_MONTH else moment.year - 1
+
+def archive_collections(year: int):
+    return (
+        db[f"assignments_archive_{year}"],
+        db[f"submissions_archive_{year}"],
+        db[f"answer_signatures_archive_{year}"]
+    )
+
+async def list_archived_years() -> List[int]:
+    names = await db.list_collection_names(filter={"name": {"$regex": "^assignments_archive_\\d+$"}})
+    return sorted(int(name.rsplit("_", 1)[1]) for name in names)
+
+async def find_assignments(query: dict, include_archived: bool = False) -> List[dict]:
+    """Find assignments in the hot collection and, optionally, every archive year"""
+    assignments = await assignments_collection.find(query).to_list(None)
+    if include_archived:
+        for year in await list_archived_years():
+            archived_assignments = archive_collections(year)[0]
+            for assignment in await archived_assignments.find(query).to_list(None):
+                assignment["archived_year"] = year
+                assignments.append(assignment)
+    return assignments
+
+def submissions_collection_for(assignment: dict):
+    year = assignment.get("archived_year")
+    if year is None:
+        return submissions_collection
+    return archive_collections(year)[1]
+
+def resolve_screenshot_path(screenshot_path: str) -> str:
+    """Absolute path of a stored screenshot; older rows hold paths relative to the server"""
+    return os.path.join(BASE_DIR, screenshot_path)
+
+def cold_storage_path(screenshot_path: str, year: int) -> str:
+    return os.path.join(COLD_STORAGE_DIR, str(year), os.path.basename(screenshot_path))
+
+def move_to_cold_storage(screenshot_path: str, year: int):
+    """Move a screenshot into the cold directory for its academic year"""
+    hot_path = resolve_screenshot_path(screenshot_path)
+    cold_path = cold_storage_path(screenshot_path, year)
+    if not os.path.exists(hot_path):
+        # Already moved by an earlier, interrupted run
+        if os.path.exists(cold_path):
+            return
+        raise FileNotFoundError(f"Screenshot {hot_path} is in neither hot nor cold storage")
+    os.makedirs(os.path.dirname(cold_path), exist_ok=True)
+    shutil.move(hot_path, cold_path)
+
+async def ensure_archive_indexes(year: int):
+    archived_assignments, archived_submissions, archived_signatures = archive_collections(year)
+    await archived_assignments.create_index("id", unique=True)
+    await archived_assignments.create_index("student_id")
+    await archived_assignments.create_index("teacher_id")
+    await archived_submissions.create_index("id", unique=True)
+    await archived_submissions.create_index("assignment_id")
+    await archived_signatures.create_index(
+        [("teacher_id", ASCENDING), ("lesson_id", ASCENDING), ("question_id", ASCENDING)]
+    )
+    await archived_signatures.create_index("id", unique=True)
+
+async def archive_batch(year: int, assignments: List[dict]) -> int:
+    """Copy one batch of a year's assignments, submissions and answer
+    signatures, verify, then delete"""
+    archived_assignments, archived_submissions, archived_signatures = archive_collections(year)
+    assignment_ids = [assignment["id"] for assignment in assignments]
+    submissions = await submissions_collection.find({"assignment_id": {"$in": assignment_ids}}).to_list(None)
+    submission_ids = [submission["id"] for submission in submissions]
+    signatures = await answer_signatures_collection.find({"submission_id": {"$in": submission_ids}}).to_list(None)
+    signature_ids = [signature["id"] for signature in signatures]
+    
+    # Fail before writing anything if a screenshot cannot be found, rather
+    # than archiving rows that point at files that were never moved
+    cold_paths = {}
+    for submission in submissions:
+        original_path = submission.get("screenshot_path")
+        if not original_path:
+            continue
+        if not (os.path.exists(resolve_screenshot_path(original_path))
+                or os.path.exists(cold_storage_path(original_path, year))):
+            raise FileNotFoundError(f"Screenshot {original_path} of submission {submission['id']} is missing")
+        cold_paths[submission["id"]] = original_path
+    
+    # Upserts keep a re-run after a partial failure idempotent
+    await archived_assignments.bulk_write(
+        [ReplaceOne({"id": doc["id"]}, doc, upsert=True) for doc in assignments], ordered=False
+    )
+    if submissions:
+        for submission in submissions:
+            if submission["id"] in cold_paths:
+                submission["screenshot_path"] = cold_storage_path(cold_paths[submission["id"]], year)
+        await archived_submissions.bulk_write(
+            [ReplaceOne({"id": doc["id"]}, doc, upsert=True) for doc in submissions], ordered=False
+        )
+    if signatures:
+        await archived_signatures.bulk_write(
+            [ReplaceOne({"id": doc["id"]}, doc, upsert=True) for doc in signatures], ordered=False
+        )
+    
+    copied_assignments = await archived_assignments.count_documents({"id": {"$in": assignment_ids}})
+    copied_submissions = await archived_submissions.count_documents({"id": {"$in": submission_ids}})
+    copied_signatures = await archived_signatures.count_documents({"id": {"$in": signature_ids}})
+    if (copied_assignments != len(assignment_ids) or copied_submissions != len(submission_ids)
+            or copied_signatures != len(signature_ids)):
+        raise RuntimeError(f"Archive verification failed for academic year {year}")
+    
+    # A student may have submitted since the batch was read; leave everything
+    # hot and let the next run pick the new submission up
+    late_submissions = await submissions_collection.count_documents({
+        "assignment_id": {"$in": assignment_ids},
+        "id": {"$nin": submission_ids}
+    })
+    if late_submissions:
+        raise RuntimeError(f"New submissions arrived while archiving academic year {year}; re-run the job")
+    
+    for original_path in cold_paths.values():
+        move_to_cold_storage(original_path, year)
+    # Assignments go first so no further submissions can be made against them
+    await assignments_collection.delete_many({"id": {"$in": assignment_ids}})
+    if signatures:
+        await answer_signatures_collection.delete_many({"id": {"$in": signature_ids}})
+    if submissions:
+        await submissions_collection.delete_many({"id": {"$in": submission_ids}})
+    
+    return len(assignment_ids)
+
+async def archive_academic_years(before_year: int, batch_size: int = ARCHIVE_BATCH_SIZE) -> Dict[int, int]:
+    """Move assignments (and their submissions) from academic years before
+    ``before_year`` into per-year archive collections. Returns counts per year."""
+    boundary = datetime(before_year, ACADEMIC_YEAR_START_MONTH, 1)
+    archived: Dict[int, int] = {}
+    while True:
+        batch = await assignments_collection.find(
+            {"assigned_at": {"$lt": boundary}}
+        ).sort("assigned_at", ASCENDING).limit(batch_size).to_list(None)
+        if not batch:
+            break
+        
+        by_year: Dict[int, List[dict]] = {}
+        for assignment in batch:
+            by_year.setdefault(academic_year_of(assignment["assigned_at"]), []).append(assignment)
+        for year, assignments in by_year.items():
+            if year not in archived:
+                await ensure_archive_indexes(year)
+                archived[year] = 0
+            archived[year] += await archive_batch(year, assignments)
+    return archived
+
+class FileRangeResponse(Response):
+    """Serve ``[start, end]`` of an already opened file without loading it into memory.
+
+    The file is opened by the handler, before any header is sent, and closed
+    once the body is written. Uses the ASGI ``http.response.zerocopysend``
+    extension (sendfile) when the server offers it, otherwise streams the
+    range in fixed-size chunks read off the event loop.
+    """
+
+    def __init__(self, file, start: int, end: int, status_code: int = 200,
+                 headers: Optional[Dict[str, str]] = None, media_type: Optional[str] = None):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.file = file
+        self.start = start
+        self.count = end - start + 1
+        self.headers["content-length"] = str(self.count)
+
+    async def __call__(self, scope, receive, send):
+        with self.file:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope["method"] == "HEAD" or self.count <= 0:
+                await send({"type": "http.response.body", "body": b""})
+                return
+            
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": self.file,
+                    "offset": self.start,
+                    "count": self.count
+                })
+                return
+            
+            offset, remaining = self.start, self.count
+            while remaining > 0:
+                chunk = await anyio.to_thread.run_sync(
+                    os.pread, self.file.fileno(), min(SCREENSHOT_CHUNK_SIZE, remaining), offset
+                )
+                if not chunk:
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b""})
+
+_BYTE_RANGE_RE = re.compile(r"(\d*)-(\d*)", re.ASCII)
+
+def parse_byte_range(range_header: str, size: int) -> Optional[tuple]:
+    """Parse a single ``bytes=`` range into inclusive offsets.
+
+    Returns None when the header should be ignored (unsupported unit,
+    multiple ranges or an invalid range-spec such as ``5-3`` or ``--5``) and
+    raises 416 when a well-formed range starts past the end of the file.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    match = _BYTE_RANGE_RE.fullmatch(spec.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = int(last) if last else size - 1
+        if last and end < start:
+            return None
+    else:
+        start, end = size - int(last), size - 1
+    start, end = max(start, 0), min(end, size - 1)
+    if start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+def weak_etag(tag: str) -> str:
+    """Opaque part of an entity tag, for weak comparison"""
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+def build_screenshot_response(request: Request, file, path: str) -> Response:
+    """Conditional, range-aware response for an opened screenshot file"""
+    stat = os.fstat(file.fileno())
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": SCREENSHOT_CACHE_CONTROL,
+        "Accept-Ranges": "bytes"
+    }
+    
+    # Conditional GET: If-None-Match takes precedence over If-Modified-Since
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        if if_none_match.strip() == "*" or weak_etag(etag) in [weak_etag(tag) for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+    elif request.headers.get("if-modified-since"):
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"]).timestamp()
+        except (TypeError, ValueError):
+            since = None
+        if since is not None and int(stat.st_mtime) <= since:
+            return Response(status_code=304, headers=headers)
+    
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range requires a strong match, so weak tags never enable a range
+    if range_header and stat.st_size and (not if_range or if_range.strip() in (etag, last_modified)):
+        byte_range = parse_byte_range(range_header, stat.st_size)
+    
+    if byte_range is None:
+        return FileRangeResponse(file, 0, stat.st_size - 1, headers=headers, media_type=media_type)
+    
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    return FileRangeResponse(file, start, end, status_code=206, headers=headers, media_type=media_type)
+
+def is_served_screenshot_path(path: str) -> bool:
+    real_path = os.path.realpath(resolve_screenshot_path(path))
+    return any(
+        os.path.commonpath([real_path, os.path.realpath(root)]) == os.path.realpath(root)
+        for root in (UPLOAD_DIR, COLD_STORAGE_DIR)
+    )
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
@@ -197,7 +852,8 @@ async def init_sample_data():
                 "description": f"ग्रेड {grade} साठी मराठी शिक्षणाचा धडा {lesson_num} (Marathi learning lesson {lesson_num} for Grade {grade})",
                 "grade": grade,
                 "questions": questions,
-                "created_at": datetime.utcnow()
+                "created_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow()
             }
             sample_lessons.append(lesson)
     
@@ -206,7 +862,9 @@ async def init_sample_data():
 
 # Authentication endpoints
 @app.post("/api/auth/student-login")
-async def student_login(login_data: StudentLogin):
+async def student_login(login_data: StudentLogin, request: Request):
+    await enforce_login_rate_limit(request, "student", login_data.student_code)
+    
     user = await users_collection.find_one({
         "student_code": login_data.student_code,
         "role": "student"
@@ -230,7 +888,9 @@ async def student_login(login_data: StudentLogin):
     }
 
 @app.post("/api/auth/teacher-login")
-async def teacher_login(login_data: TeacherLogin):
+async def teacher_login(login_data: TeacherLogin, request: Request):
+    await enforce_login_rate_limit(request, "teacher", login_data.username)
+    
     user = await users_collection.find_one({
         "username": login_data.username,
         "role": "teacher"
@@ -255,14 +915,17 @@ async def teacher_login(login_data: TeacherLogin):
 
 # Student endpoints
 @app.get("/api/student/assignments")
-async def get_student_assignments(current_user: dict = Depends(get_current_user)):
+async def get_student_assignments(
+    include_archived: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
     if current_user["role"] != "student":
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Get assignments for this student
-    assignments = await assignments_collection.find({
+    assignments = await find_assignments({
         "student_id": current_user["id"]
-    }).to_list(None)
+    }, include_archived)
     
     # Get lesson details for each assignment
     for assignment in assignments:
@@ -270,7 +933,7 @@ async def get_student_assignments(current_user: dict = Depends(get_current_user)
         assignment["lesson"] = serialize_doc(lesson)
         
         # Check if submitted
-        submission = await submissions_collection.find_one({
+        submission = await submissions_collection_for(assignment).find_one({
             "assignment_id": assignment["id"]
         })
         assignment["status"] = "completed" if submission else "pending"
@@ -310,13 +973,12 @@ async def submit_assignment(
     screenshot_path = None
     if screenshot:
         # Create uploads directory if it doesn't exist
-        upload_dir = "uploads"
-        os.makedirs(upload_dir, exist_ok=True)
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
         
         # Save file
         file_extension = screenshot.filename.split('.')[-1]
         screenshot_filename = f"{assignment_id}_{uuid.uuid4()}.{file_extension}"
-        screenshot_path = os.path.join(upload_dir, screenshot_filename)
+        screenshot_path = os.path.join(UPLOAD_DIR, screenshot_filename)
         
         with open(screenshot_path, "wb") as buffer:
             content = await screenshot.read()
@@ -327,6 +989,7 @@ async def submit_assignment(
         "id": str(uuid.uuid4()),
         "assignment_id": assignment_id,
         "student_id": current_user["id"],
+        "teacher_id": assignment["teacher_id"],
         "answers": json.loads(answers),
         "screenshot_path": screenshot_path,
         "submitted_at": datetime.utcnow(),
@@ -335,6 +998,13 @@ async def submit_assignment(
     
     await submissions_collection.insert_one(submission)
     
+    # Index text answers for near-duplicate detection
+    lesson = await lessons_collection.find_one({"id": assignment["lesson_id"]})
+    if lesson:
+        signatures = build_answer_signatures(submission, assignment, lesson)
+        if signatures:
+            await answer_signatures_collection.insert_many(signatures)
+    
     return {"message": "Assignment submitted successfully"}
 
 # Teacher endpoints
@@ -361,6 +1031,45 @@ async def get_teacher_lessons(current_user: dict = Depends(get_current_user)):
     
     return serialize_doc(lessons)
 
+@app.get("/api/teacher/lessons/search")
+async def search_teacher_lessons(
+    q: str,
+    page: int = 1,
+    page_size: int = SEARCH_DEFAULT_PAGE_SIZE,
+    current_user: dict = Depends(get_current_user)
+):
+    if current_user["role"] != "teacher":
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    if page < 1 or not 1 <= page_size <= SEARCH_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail="Invalid pagination parameters")
+    
+    # Two indexed lookups catch lessons written outside this process
+    await refresh_search_index(current_user["grade"])
+    ranked = lesson_search_index.search(current_user["grade"], q)
+    page_hits = ranked[(page - 1) * page_size:page * page_size]
+    
+    # Only the requested page is loaded from the database
+    lessons = await lessons_collection.find({
+        "id": {"$in": [lesson_id for lesson_id, _ in page_hits]}
+    }).to_list(None)
+    lessons_by_id = {lesson["id"]: lesson for lesson in lessons}
+    
+    results = []
+    for lesson_id, score in page_hits:
+        lesson = lessons_by_id.get(lesson_id)
+        if lesson is None:
+            continue
+        lesson["score"] = round(score, 4)
+        results.append(serialize_doc(lesson))
+    
+    return {
+        "total": len(ranked),
+        "page": page,
+        "page_size": page_size,
+        "results": results
+    }
+
 @app.post("/api/teacher/assign")
 async def assign_homework(
     homework_data: AssignHomework,
@@ -408,13 +1117,16 @@ async def assign_homework(
     return {"message": f"Homework assigned to {len(assignments)} students"}
 
 @app.get("/api/teacher/assignments")
-async def get_teacher_assignments(current_user: dict = Depends(get_current_user)):
+async def get_teacher_assignments(
+    include_archived: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
     if current_user["role"] != "teacher":
         raise HTTPException(status_code=403, detail="Access denied")
     
-    assignments = await assignments_collection.find({
+    assignments = await find_assignments({
         "teacher_id": current_user["id"]
-    }).to_list(None)
+    }, include_archived)
     
     # Get additional details
     for assignment in assignments:
@@ -427,24 +1139,231 @@ async def get_teacher_assignments(current_user: dict = Depends(get_current_user)
         assignment["lesson"] = serialize_doc(lesson)
         
         # Check if submitted
-        submission = await submissions_collection.find_one({
+        submission = await submissions_collection_for(assignment).find_one({
             "assignment_id": assignment["id"]
         })
         assignment["status"] = "completed" if submission else "pending"
         if submission:
             assignment["submitted_at"] = submission["submitted_at"]
+            assignment["submission_id"] = submission["id"]
+            assignment["has_screenshot"] = bool(submission.get("screenshot_path"))
     
     return serialize_doc(assignments)
 
+@app.get("/api/teacher/similar-answers")
+async def get_similar_answers(
+    lesson_id: str,
+    question_id: Optional[str] = None,
+    threshold: float = SIMILARITY_THRESHOLD,
+    include_archived: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    if current_user["role"] != "teacher":
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    if not 0 < threshold <= 1:
+        raise HTTPException(status_code=400, detail="Threshold must be between 0 and 1")
+    
+    match = {"teacher_id": current_user["id"], "lesson_id": lesson_id}
+    if question_id:
+        match["question_id"] = question_id
+    
+    archived_years = await list_archived_years() if include_archived else []
+    
+    # Let the database group answers by shared LSH bucket so only
+    # candidate pairs are ever compared
+    pipeline = [{"$match": match}]
+    for year in archived_years:
+        pipeline.append({"$unionWith": {
+            "coll": archive_collections(year)[2].name,
+            "pipeline": [{"$match": match}]
+        }})
+    pipeline += [
+        {"$unwind": "$lsh_buckets"},
+        {"$group": {
+            "_id": {"question_id": "$question_id", "bucket": "$lsh_buckets"},
+            "members": {"$addToSet": "$id"},
+        }},
+        {"$match": {"members.1": {"$exists": True}}},
+    ]
+    candidate_groups = await answer_signatures_collection.aggregate(pipeline).to_list(None)
+    
+    candidate_ids = {member for group in candidate_groups for member in group["members"]}
+    if not candidate_ids:
+        return []
+    
+    signatures = await answer_signatures_collection.find(
+        {"id": {"$in": list(candidate_ids)}},
+        {"_id": 0, "lsh_buckets": 0}
+    ).to_list(None)
+    for year in archived_years:
+        archived = await archive_collections(year)[2].find(
+            {"id": {"$in": list(candidate_ids)}},
+            {"_id": 0, "lsh_buckets": 0}
+        ).to_list(None)
+        for signature in archived:
+            signature["archived_year"] = year
+        signatures.extend(archived)
+    by_id = {signature["id"]: signature for signature in signatures}
+    
+    # Union-find over verified candidate pairs
+    parent = {signature_id: signature_id for signature_id in by_id}
+    
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+    
+    # Identical normalized answers are merged directly, so common copies
+    # never turn a bucket into a quadratic number of comparisons
+    representatives: Dict[tuple, str] = {}
+    for signature_id, signature in by_id.items():
+        key = (signature["question_id"], signature["normalized"])
+        if key in representatives:
+            parent[find(signature_id)] = find(representatives[key])
+        else:
+            representatives[key] = signature_id
+    
+    checked = set()
+    for group in candidate_groups:
+        members = sorted({
+            representatives[(by_id[member]["question_id"], by_id[member]["normalized"])]
+            for member in group["members"] if member in by_id
+        })
+        for i, first in enumerate(members):
+            for second in members[i + 1:]:
+                if (first, second) in checked or find(first) == find(second):
+                    continue
+                checked.add((first, second))
+                if estimate_similarity(by_id[first]["minhash"], by_id[second]["minhash"]) >= threshold:
+                    parent[find(first)] = find(second)
+    
+    clusters: Dict[str, List[dict]] = {}
+    for signature_id, signature in by_id.items():
+        clusters.setdefault(find(signature_id), []).append(signature)
+    
+    result = []
+    for members in clusters.values():
+        if len(members) < 2:
+            continue
+        result.append({
+            "question_id": members[0]["question_id"],
+            "answers": [
+                {
+                    "submission_id": member["submission_id"],
+                    "assignment_id": member["assignment_id"],
+                    "student_id": member["student_id"],
+                    "answer": member["answer"],
+                    "archived_year": member.get("archived_year")
+                }
+                for member in sorted(members, key=lambda member: member["student_id"])
+            ]
+        })
+    result.sort(key=lambda cluster: (cluster["question_id"], -len(cluster["answers"])))
+    
+    return result
+
+@app.api_route("/api/teacher/submissions/{submission_id}/screenshot", methods=["GET", "HEAD"])
+async def get_submission_screenshot(
+    submission_id: str,
+    request: Request,
+    archived_year: Optional[int] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    if current_user["role"] != "teacher":
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    collection = submissions_collection if archived_year is None else archive_collections(archived_year)[1]
+    submission = await collection.find_one(
+        {"id": submission_id},
+        {"_id": 0, "assignment_id": 1, "teacher_id": 1, "screenshot_path": 1}
+    )
+    if submission and "teacher_id" not in submission:
+        # Submissions stored before teacher_id was recorded on them
+        assignments = await find_assignments({"id": submission["assignment_id"]}, archived_year is not None)
+        submission["teacher_id"] = assignments[0]["teacher_id"] if assignments else None
+    
+    if not submission or submission["teacher_id"] != current_user["id"]:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    
+    screenshot_path = submission.get("screenshot_path")
+    if not screenshot_path or not is_served_screenshot_path(screenshot_path):
+        raise HTTPException(status_code=404, detail="Screenshot not found")
+    screenshot_path = resolve_screenshot_path(screenshot_path)
+    # Open before any header is sent so a vanished file is a clean 404
+    try:
+        file = await anyio.to_thread.run_sync(open, screenshot_path, "rb")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Screenshot not found")
+    
+    try:
+        response = build_screenshot_response(request, file, screenshot_path)
+    except BaseException:
+        file.close()
+        raise
+    if not isinstance(response, FileRangeResponse):
+        file.close()
+    return response
+
 # Health check
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow()}
 
-# Initialize sample data on startup
+SEARCH_INDEX_PROJECTION = {"_id": 0, "id": 1, "grade": 1, "title": 1, "description": 1, "questions.question": 1}
+
+async def init_search_index():
+    for grade in await lessons_collection.distinct("grade"):
+        await refresh_search_index(grade)
+
+async def refresh_search_index(grade: int):
+    """Reload a grade when its lessons changed since it was indexed.
+
+    Nothing in this service writes lessons, so every change arrives from
+    outside the process; writers must bump ``updated_at`` on edits.
+    """
+    lesson_count = await lessons_collection.count_documents({"grade": grade})
+    latest = await lessons_collection.find_one(
+        {"grade": grade}, {"_id": 0, "updated_at": 1}, sort=[("updated_at", DESCENDING)]
+    )
+    version = (lesson_count, latest.get("updated_at") if latest else None)
+    if lesson_search_index.versions.get(grade) == version:
+        return
+    lesson_ids = set()
+    async for lesson in lessons_collection.find({"grade": grade}, SEARCH_INDEX_PROJECTION):
+        lesson_search_index.add_lesson(lesson)
+        lesson_ids.add(lesson["id"])
+    for lesson_id, (indexed_grade, _) in list(lesson_search_index.lesson_terms.items()):
+        if indexed_grade == grade and lesson_id not in lesson_ids:
+            lesson_search_index.remove_lesson(lesson_id)
+    lesson_search_index.versions[grade] = version
+
+async def init_indexes():
+    await answer_signatures_collection.create_index(
+        [("teacher_id", ASCENDING), ("lesson_id", ASCENDING), ("question_id", ASCENDING)]
+    )
+    await answer_signatures_collection.create_index("id", unique=True)
+    await lessons_collection.create_index("id", unique=True)
+    await lessons_collection.create_index([("grade", ASCENDING), ("updated_at", DESCENDING)])
+    await users_collection.create_index([("student_code", ASCENDING), ("role", ASCENDING)])
+    await users_collection.create_index([("username", ASCENDING), ("role", ASCENDING)])
+    await users_collection.create_index("id", unique=True)
+    await rate_limits_collection.create_index("key", unique=True)
+    await assignments_collection.create_index("id", unique=True)
+    await assignments_collection.create_index("student_id")
+    await assignments_collection.create_index("teacher_id")
+    await assignments_collection.create_index("assigned_at")
+    await submissions_collection.create_index("assignment_id")
+    await submissions_collection.create_index("id", unique=True)
+    await rate_limits_collection.create_index("updated_at", expireAfterSeconds=3600)
+
+# Initialize indexes and sample data on startup
 @app.on_event("startup")
 async def startup_event():
+    await init_indexes()
     await init_sample_data()
+    await init_search_index()
 
 if __name__ == "__main__":
     import uvicorn
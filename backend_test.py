@@ -1,6 +1,7 @@
 import requests
 import sys
 import json
+import uuid
 from datetime import datetime, timedelta
 
 class MarathiVidyaAPITester:
@@ -20,8 +21,8 @@ class MarathiVidyaAPITester:
         if token:
             headers['Authorization'] = f'Bearer {token}'
         
-        # For file uploads, remove Content-Type header
-        if files:
+        # For form and file uploads, remove Content-Type header
+        if files is not None:
             headers.pop('Content-Type', None)
 
         self.tests_run += 1
@@ -32,7 +33,7 @@ class MarathiVidyaAPITester:
             if method == 'GET':
                 response = requests.get(url, headers=headers)
             elif method == 'POST':
-                if files:
+                if files is not None:
                     response = requests.post(url, data=data, files=files, headers=headers)
                 else:
                     response = requests.post(url, json=data, headers=headers)
@@ -117,6 +118,30 @@ class MarathiVidyaAPITester:
             data={"username": "invalid", "password": "wrong"}
         )[0]
 
+    def test_login_rate_limit(self):
+        """Test that repeated failed logins for one account get throttled.
+
+        Uses a fresh probe account per run so the suite can be re-run at once.
+        It spends about six teacher-login IP tokens; if the server runs with
+        lowered TEACHER_LOGIN_RATE_LIMIT_IP_* values, raise them for test runs.
+        """
+        probe = f"ratelimit-probe-{uuid.uuid4().hex[:8]}"
+        for _ in range(10):
+            response = requests.post(
+                f"{self.base_url}/api/auth/teacher-login",
+                json={"username": probe, "password": "wrong"}
+            )
+            if response.status_code == 429:
+                break
+
+        return self.run_test(
+            "Teacher Login (Rate Limited)",
+            "POST",
+            "api/auth/teacher-login",
+            429,
+            data={"username": probe, "password": "wrong"}
+        )[0]
+
     def test_student_assignments(self):
         """Test getting student assignments"""
         if not self.student_token:
@@ -167,6 +192,48 @@ class MarathiVidyaAPITester:
             return True
         return False
 
+    def test_search_lessons(self):
+        """Test lesson search ranking and pagination.
+
+        Every sample lesson has "Question 3", but only lesson 3 has 3 in its
+        title, so it must rank first and all ten grade lessons must match.
+        """
+        if not self.teacher_token:
+            print("❌ Skipping - No teacher token available")
+            return False
+
+        success, first_page = self.run_test(
+            "Search Lessons (Page 1)",
+            "GET",
+            "api/teacher/lessons/search?q=3&page=1&page_size=5",
+            200,
+            token=self.teacher_token
+        )
+        if not success or not isinstance(first_page.get('results'), list):
+            return False
+        success, second_page = self.run_test(
+            "Search Lessons (Page 2)",
+            "GET",
+            "api/teacher/lessons/search?q=3&page=2&page_size=5",
+            200,
+            token=self.teacher_token
+        )
+        if not success or not isinstance(second_page.get('results'), list):
+            return False
+
+        first_ids = {lesson['id'] for lesson in first_page['results']}
+        second_ids = {lesson['id'] for lesson in second_page['results']}
+        print(f"   Found {first_page['total']} matching lessons")
+        return (
+            first_page['total'] == 10
+            and second_page['total'] == 10
+            and len(first_ids) == 5
+            and len(second_ids) == 5
+            and not first_ids & second_ids
+            and "(Lesson 3 -" in first_page['results'][0]['title']
+            and first_page['results'][0]['score'] > first_page['results'][1]['score']
+        )
+
     def test_assign_homework(self):
         """Test homework assignment"""
         if not self.teacher_token:
@@ -234,6 +301,158 @@ class MarathiVidyaAPITester:
             return True
         return False
 
+    def test_teacher_assignments_with_archive(self):
+        """Test getting teacher assignments including archived academic years"""
+        if not self.teacher_token:
+            print("❌ Skipping - No teacher token available")
+            return False
+        
+        success, response = self.run_test(
+            "Get Teacher Assignments (Including Archived)",
+            "GET",
+            "api/teacher/assignments?include_archived=true",
+            200,
+            token=self.teacher_token
+        )
+        if success and isinstance(response, list):
+            archived = sum(1 for assignment in response if 'archived_year' in assignment)
+            print(f"   Found {len(response)} assignments ({archived} archived)")
+            return True
+        return False
+
+    def run_raw_test(self, name, endpoint, expected_status, token=None, headers=None):
+        """Run a GET test and return the raw response for header checks"""
+        request_headers = dict(headers or {})
+        if token:
+            request_headers['Authorization'] = f'Bearer {token}'
+
+        self.tests_run += 1
+        print(f"\n🔍 Testing {name}...")
+        try:
+            response = requests.get(f"{self.base_url}/{endpoint}", headers=request_headers)
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            return False, None
+
+        if response.status_code == expected_status:
+            self.tests_passed += 1
+            print(f"✅ Passed - Status: {response.status_code}")
+            return True, response
+        print(f"❌ Failed - Expected {expected_status}, got {response.status_code}")
+        return False, response
+
+    def test_submission_screenshot(self):
+        """Test screenshot serving: ranges, conditional GETs, cache headers and access"""
+        if not self.teacher_token:
+            print("❌ Skipping - No teacher token available")
+            return False
+
+        lessons_success, lessons_data = self.run_test(
+            "Get Lessons for Screenshot",
+            "GET",
+            "api/teacher/lessons",
+            200,
+            token=self.teacher_token
+        )
+        if not lessons_success or len(lessons_data) < 3:
+            print("❌ No lessons available")
+            return False
+
+        image = b"\x89PNG\r\n\x1a\n" + bytes(range(92))
+        _, assignment_id = self.submit_lesson_as(
+            "ST105", lessons_data[2], {},
+            files={"screenshot": ("screenshot.png", image, "image/png")}
+        )
+        if not assignment_id:
+            print("❌ Could not submit screenshot")
+            return False
+
+        _, assignments = self.run_test(
+            "Get Teacher Assignments for Screenshot",
+            "GET",
+            "api/teacher/assignments",
+            200,
+            token=self.teacher_token
+        )
+        assignment = next((a for a in assignments or [] if a['id'] == assignment_id), None)
+        if not assignment or not assignment.get('has_screenshot'):
+            print("❌ Submitted screenshot not listed")
+            return False
+        endpoint = f"api/teacher/submissions/{assignment['submission_id']}/screenshot"
+        size = len(image)
+        results = []
+
+        success, full = self.run_raw_test("Get Screenshot", endpoint, 200, token=self.teacher_token)
+        if not success:
+            return False
+        etag = full.headers.get('ETag')
+        last_modified = full.headers.get('Last-Modified')
+        results.append(
+            full.content == image
+            and etag is not None
+            and last_modified is not None
+            and 'immutable' in full.headers.get('Cache-Control', '')
+            and full.headers.get('Accept-Ranges') == 'bytes'
+        )
+
+        success, partial = self.run_raw_test(
+            "Get Screenshot (Range)", endpoint, 206,
+            token=self.teacher_token, headers={'Range': 'bytes=0-9'}
+        )
+        results.append(
+            success
+            and partial.content == image[:10]
+            and partial.headers.get('Content-Range') == f"bytes 0-9/{size}"
+        )
+
+        success, unsatisfiable = self.run_raw_test(
+            "Get Screenshot (Unsatisfiable Range)", endpoint, 416,
+            token=self.teacher_token, headers={'Range': f'bytes={size}-'}
+        )
+        results.append(success and unsatisfiable.headers.get('Content-Range') == f"bytes */{size}")
+
+        results.append(self.run_raw_test(
+            "Get Screenshot (Invalid Range Ignored)", endpoint, 200,
+            token=self.teacher_token, headers={'Range': 'bytes=5-3'}
+        )[0])
+
+        results.append(self.run_raw_test(
+            "Get Screenshot (If-None-Match)", endpoint, 304,
+            token=self.teacher_token, headers={'If-None-Match': etag}
+        )[0])
+
+        results.append(self.run_raw_test(
+            "Get Screenshot (If-Modified-Since)", endpoint, 304,
+            token=self.teacher_token, headers={'If-Modified-Since': last_modified}
+        )[0])
+
+        success, stale = self.run_raw_test(
+            "Get Screenshot (Stale If-Range)", endpoint, 200,
+            token=self.teacher_token, headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'}
+        )
+        results.append(success and stale.content == image)
+
+        other_success, other_teacher = self.run_test(
+            "Teacher Login (Other Teacher)",
+            "POST",
+            "api/auth/teacher-login",
+            200,
+            data={"username": "teacher2", "password": "password123"}
+        )
+        results.append(other_success and self.run_raw_test(
+            "Get Screenshot (Other Teacher)", endpoint, 404,
+            token=other_teacher['access_token']
+        )[0])
+
+        results.append(self.run_raw_test(
+            "Get Screenshot (Unknown Submission)",
+            "api/teacher/submissions/does-not-exist/screenshot",
+            404,
+            token=self.teacher_token
+        )[0])
+
+        return all(results)
+
     def test_student_assignments_after_assignment(self):
         """Test student assignments after homework is assigned"""
         if not self.student_token:
@@ -252,6 +471,124 @@ class MarathiVidyaAPITester:
             return True
         return False
 
+    def submit_lesson_as(self, student_code, lesson, answers, files=None):
+        """Assign a lesson to a student, log in as them and submit it as a form.
+
+        Returns the student's token and the submitted assignment id.
+        """
+        students_success, students_data = self.run_test(
+            f"Get Students to Assign {student_code}",
+            "GET",
+            "api/teacher/students",
+            200,
+            token=self.teacher_token
+        )
+        student = next((s for s in students_data if s.get('student_code') == student_code), None) if students_success else None
+        if not student:
+            print(f"❌ Student {student_code} not found")
+            return None, None
+
+        due_date = (datetime.now() + timedelta(days=7)).isoformat()
+        assigned, _ = self.run_test(
+            f"Assign Lesson to {student_code}",
+            "POST",
+            "api/teacher/assign",
+            200,
+            data={"lesson_id": lesson['id'], "student_ids": [student['id']], "due_date": due_date},
+            token=self.teacher_token
+        )
+        login_success, login_data = self.run_test(
+            f"Student Login ({student_code})",
+            "POST",
+            "api/auth/student-login",
+            200,
+            data={"student_code": student_code}
+        )
+        if not (assigned and login_success):
+            return None, None
+        token = login_data['access_token']
+
+        _, assignments = self.run_test(
+            f"Get Assignments for {student_code}",
+            "GET",
+            "api/student/assignments",
+            200,
+            token=token
+        )
+        pending = [
+            a for a in assignments or []
+            if a['lesson_id'] == lesson['id'] and a['status'] == 'pending'
+        ]
+        if not pending:
+            print(f"❌ No pending assignment for {student_code}")
+            return token, None
+        assignment_id = pending[0]['id']
+
+        submitted, _ = self.run_test(
+            f"Submit Assignment ({student_code})",
+            "POST",
+            "api/student/submit",
+            200,
+            data={"assignment_id": assignment_id, "answers": json.dumps(answers)},
+            token=token,
+            files=files if files is not None else {}
+        )
+        return token, assignment_id if submitted else None
+
+    def test_similar_answers(self):
+        """Test that near-identical text answers are clustered together"""
+        if not self.teacher_token:
+            print("❌ Skipping - No teacher token available")
+            return False
+
+        lessons_success, lessons_data = self.run_test(
+            "Get Lessons for Similar Answers",
+            "GET",
+            "api/teacher/lessons",
+            200,
+            token=self.teacher_token
+        )
+        if not lessons_success or len(lessons_data) < 2:
+            print("❌ No lessons available")
+            return False
+        lesson = lessons_data[1]
+        question_id = next(q['id'] for q in lesson['questions'] if q['type'] == 'text')
+
+        # Copies differ only in ी/ि and punctuation; the third answer is original
+        copied = "माझे आवडते रंग लाल, निळा आणि पिवळा आहेत।"
+        near_copy = "माझे आवडते रंग लाल निळा आणी पिवळा आहेत"
+        different = "मला हिरवा रंग आवडतो कारण झाडे हिरवी असतात"
+        _, first = self.submit_lesson_as("ST102", lesson, {question_id: copied})
+        _, second = self.submit_lesson_as("ST103", lesson, {question_id: near_copy})
+        _, third = self.submit_lesson_as("ST104", lesson, {question_id: different})
+        if not (first and second and third):
+            print("❌ Could not submit answers")
+            return False
+
+        success, response = self.run_test(
+            "Get Similar Answers",
+            "GET",
+            f"api/teacher/similar-answers?lesson_id={lesson['id']}&question_id={question_id}",
+            200,
+            token=self.teacher_token
+        )
+        if not success or not isinstance(response, list):
+            return False
+
+        # Earlier runs may have added copies of the same answers, so only
+        # check the cluster holding this run's submissions
+        clusters = [
+            {answer['assignment_id'] for answer in cluster['answers']}
+            for cluster in response
+        ]
+        matching = [cluster for cluster in clusters if first in cluster]
+        print(f"   Found {len(response)} clusters of similar answers")
+        return (
+            len(matching) == 1
+            and second in matching[0]
+            and all(third not in cluster for cluster in clusters)
+        )
+
     def test_unauthorized_access(self):
         """Test unauthorized access to protected endpoints"""
         success1 = self.run_test(
@@ -287,6 +624,7 @@ def main():
     test_results.append(tester.test_student_login_invalid())
     test_results.append(tester.test_teacher_login_valid())
     test_results.append(tester.test_teacher_login_invalid())
+    test_results.append(tester.test_login_rate_limit())
     
     # Unauthorized access tests
     test_results.append(tester.test_unauthorized_access())
@@ -297,10 +635,14 @@ def main():
     # Teacher endpoints (requires valid teacher login)
     test_results.append(tester.test_teacher_students())
     test_results.append(tester.test_teacher_lessons())
+    test_results.append(tester.test_search_lessons())
     
     # Homework assignment workflow
     test_results.append(tester.test_assign_homework())
     test_results.append(tester.test_teacher_assignments())
+    test_results.append(tester.test_teacher_assignments_with_archive())
+    test_results.append(tester.test_submission_screenshot())
+    test_results.append(tester.test_similar_answers())
     
     # Check student assignments after homework assigned
     test_results.append(tester.test_student_assignments_after_assignment())
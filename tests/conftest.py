@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Keep tests away from the application database; set before server is imported
+os.environ.setdefault("DB_NAME", "marathi_vidya_test")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
@@ -0,0 +1,143 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+import server
+
+
+def mongo_available():
+    try:
+        MongoClient(server.MONGO_URL, serverSelectionTimeoutMS=1000).admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+
+
+pytestmark = pytest.mark.skipif(not mongo_available(), reason="MongoDB is not reachable")
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(server, "COLD_STORAGE_DIR", str(tmp_path / "cold"))
+    os.makedirs(server.UPLOAD_DIR)
+    MongoClient(server.MONGO_URL).drop_database(server.DB_NAME)
+    yield tmp_path
+    MongoClient(server.MONGO_URL).drop_database(server.DB_NAME)
+
+
+async def seed_submission(teacher, student, lesson, assigned_at, screenshot=True):
+    assignment = {
+        "id": str(uuid.uuid4()),
+        "teacher_id": teacher["id"],
+        "student_id": student["id"],
+        "lesson_id": lesson["id"],
+        "due_date": assigned_at,
+        "assigned_at": assigned_at,
+        "created_at": assigned_at
+    }
+    screenshot_path = None
+    if screenshot:
+        screenshot_path = os.path.join(server.UPLOAD_DIR, f"{assignment['id']}_shot.png")
+        with open(screenshot_path, "wb") as file:
+            file.write(b"\x89PNG screenshot")
+    submission = {
+        "id": str(uuid.uuid4()),
+        "assignment_id": assignment["id"],
+        "student_id": student["id"],
+        "teacher_id": teacher["id"],
+        "answers": {"q-text": "माझे आवडते रंग लाल निळा आणि पिवळा आहेत"},
+        "screenshot_path": screenshot_path,
+        "submitted_at": assigned_at,
+        "created_at": assigned_at
+    }
+    await server.assignments_collection.insert_one(assignment)
+    await server.submissions_collection.insert_one(submission)
+    await server.answer_signatures_collection.insert_many(
+        server.build_answer_signatures(submission, assignment, lesson)
+    )
+    return assignment, submission
+
+
+def make_fixtures():
+    teacher = {"id": str(uuid.uuid4()), "role": "teacher", "grade": 1}
+    student = {"id": str(uuid.uuid4()), "role": "student", "grade": 1}
+    lesson = {
+        "id": str(uuid.uuid4()),
+        "grade": 1,
+        "title": "धडा",
+        "description": "धडा",
+        "questions": [{"id": "q-text", "question": "रंग?", "type": "text"}]
+    }
+    return teacher, student, lesson
+
+
+def test_archive_moves_past_year_and_is_idempotent(storage):
+    async def scenario():
+        teacher, student, lesson = make_fixtures()
+        await server.lessons_collection.insert_one(dict(lesson))
+        old_assignment, old_submission = await seed_submission(
+            teacher, student, lesson, datetime(2022, 9, 1)
+        )
+        current_assignment, _ = await seed_submission(
+            teacher, student, lesson, datetime.utcnow(), screenshot=False
+        )
+
+        archived = await server.archive_academic_years(datetime.utcnow().year - 1)
+        assert archived == {2022: 1}
+
+        archived_assignments, archived_submissions, archived_signatures = server.archive_collections(2022)
+        assert await archived_assignments.count_documents({"id": old_assignment["id"]}) == 1
+        archived_submission = await archived_submissions.find_one({"id": old_submission["id"]})
+        cold_path = os.path.join(server.COLD_STORAGE_DIR, "2022", os.path.basename(old_submission["screenshot_path"]))
+        assert archived_submission["screenshot_path"] == cold_path
+        assert os.path.exists(cold_path)
+        assert not os.path.exists(old_submission["screenshot_path"])
+        assert await archived_signatures.count_documents({"submission_id": old_submission["id"]}) == 1
+
+        assert await server.assignments_collection.count_documents({"id": old_assignment["id"]}) == 0
+        assert await server.submissions_collection.count_documents({"id": old_submission["id"]}) == 0
+        assert await server.answer_signatures_collection.count_documents({"submission_id": old_submission["id"]}) == 0
+        assert await server.assignments_collection.count_documents({"id": current_assignment["id"]}) == 1
+
+        for endpoint, user in (
+            (server.get_student_assignments, student),
+            (server.get_teacher_assignments, teacher),
+        ):
+            hot = await endpoint(include_archived=False, current_user=user)
+            assert [a["id"] for a in hot] == [current_assignment["id"]]
+            everything = await endpoint(include_archived=True, current_user=user)
+            by_id = {a["id"]: a for a in everything}
+            assert set(by_id) == {current_assignment["id"], old_assignment["id"]}
+            assert by_id[old_assignment["id"]]["archived_year"] == 2022
+            assert by_id[old_assignment["id"]]["status"] == "completed"
+
+        assert await server.archive_academic_years(datetime.utcnow().year - 1) == {}
+        assert await archived_assignments.count_documents({}) == 1
+        assert await archived_submissions.count_documents({}) == 1
+        assert await archived_signatures.count_documents({}) == 1
+        assert os.path.exists(cold_path)
+
+    asyncio.run(scenario())
+
+
+def test_archive_keeps_rows_hot_when_screenshot_is_missing(storage):
+    async def scenario():
+        teacher, student, lesson = make_fixtures()
+        await server.lessons_collection.insert_one(dict(lesson))
+        assignment, submission = await seed_submission(teacher, student, lesson, datetime(2022, 9, 1))
+        os.remove(submission["screenshot_path"])
+
+        with pytest.raises(FileNotFoundError):
+            await server.archive_academic_years(datetime.utcnow().year - 1)
+
+        assert await server.assignments_collection.count_documents({"id": assignment["id"]}) == 1
+        assert await server.submissions_collection.count_documents({"id": submission["id"]}) == 1
+        assert await server.archive_collections(2022)[1].count_documents({}) == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,47 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi import HTTPException, Request
+
+import server
+
+
+def make_request(peer, forwarded=None, path="/api/auth/student-login"):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "headers": headers,
+        "client": (peer, 50000),
+    })
+
+
+def test_client_ip_uses_hop_appended_by_trusted_proxy():
+    request = make_request("10.0.0.5", "1.2.3.4, 203.0.113.7")
+    assert server.get_client_ip(request) == "203.0.113.7"
+
+
+def test_client_ip_ignores_forwarded_header_from_untrusted_peer():
+    request = make_request("203.0.113.7", "1.2.3.4")
+    assert server.get_client_ip(request) == "203.0.113.7"
+
+
+def test_spoofed_forwarded_for_does_not_reset_ip_bucket(monkeypatch):
+    monkeypatch.setitem(server.LOGIN_IP_LIMITS, "student", (3, 3))
+    monkeypatch.setitem(server.login_ip_limiters, "student", server.TokenBucketLimiter(3, 3))
+    monkeypatch.setattr(server, "RATE_LIMIT_BACKEND", "memory")
+
+    async def attempt():
+        # A fresh spoofed address and a fresh student code on every try,
+        # appended to by the ingress with the attacker's real address
+        request = make_request("10.0.0.5", f"198.51.100.{uuid.uuid4().int % 250}, 203.0.113.7")
+        await server.enforce_login_rate_limit(request, "student", uuid.uuid4().hex[:5])
+
+    for _ in range(3):
+        asyncio.run(attempt())
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(attempt())
+    assert excinfo.value.status_code == 429
+    assert "Retry-After" in excinfo.value.headers
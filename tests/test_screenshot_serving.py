@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException, Request
+
+import server
+
+IMAGE = bytes(range(100))
+
+
+def make_request(headers=None, method="GET"):
+    return Request({
+        "type": "http",
+        "method": method,
+        "path": "/api/teacher/submissions/s/screenshot",
+        "headers": [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()],
+    })
+
+
+def serve(path, headers=None):
+    """Build and run a screenshot response, returning status, headers and body"""
+    request = make_request(headers)
+    file = open(path, "rb")
+    response = server.build_screenshot_response(request, file, str(path))
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    if isinstance(response, server.FileRangeResponse):
+        asyncio.run(response(request.scope, None, send))
+        status = messages[0]["status"]
+        body = b"".join(message.get("body", b"") for message in messages[1:])
+    else:
+        file.close()
+        status, body = response.status_code, response.body
+    assert file.closed
+    return status, response.headers, body
+
+
+@pytest.fixture
+def screenshot(tmp_path):
+    path = tmp_path / "shot.png"
+    path.write_bytes(IMAGE)
+    return path
+
+
+@pytest.mark.parametrize("header", ["bytes=5-3", "bytes=--5", "bytes=x-", "bytes=0-1,3-4", "items=0-1"])
+def test_invalid_ranges_are_ignored(header):
+    assert server.parse_byte_range(header, 10) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=10-", "bytes=20-30", "bytes=-0"])
+def test_ranges_past_the_end_are_unsatisfiable(header):
+    with pytest.raises(HTTPException) as excinfo:
+        server.parse_byte_range(header, 10)
+    assert excinfo.value.status_code == 416
+
+
+def test_range_request_returns_partial_content(screenshot):
+    status, headers, body = serve(screenshot, {"Range": "bytes=10-19"})
+    assert status == 206
+    assert body == IMAGE[10:20]
+    assert headers["content-range"] == f"bytes 10-19/{len(IMAGE)}"
+
+
+def test_full_response_has_cache_headers(screenshot):
+    status, headers, body = serve(screenshot)
+    assert status == 200
+    assert body == IMAGE
+    assert "immutable" in headers["cache-control"]
+    assert headers["accept-ranges"] == "bytes"
+
+
+def test_if_none_match_uses_weak_comparison(screenshot):
+    _, headers, _ = serve(screenshot)
+    status, _, _ = serve(screenshot, {"If-None-Match": f"W/{headers['etag']}"})
+    assert status == 304
+
+
+def test_stale_if_range_serves_whole_file(screenshot):
+    status, _, body = serve(screenshot, {"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert status == 200
+    assert body == IMAGE